@@ -99,6 +99,8 @@ in
             DynamicUser = "yes";
             StateDirectory = "aquaorder";
             StateDirectoryMode = "0755";
+            # tmpfs for the LaTeX build directories
+            RuntimeDirectory = "aquaorder";
             PrivateDevices = true;
             # Sandboxing
             CapabilityBoundingSet = "CAP_NET_RAW CAP_NET_ADMIN";
@@ -0,0 +1,66 @@
+"""
+aquaorder
+Copyright (C) 2022  schnusch
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import importlib.resources
+import mimetypes
+import os.path
+from functools import lru_cache
+from typing import Dict, Mapping, NamedTuple
+
+from . import resources
+
+# static files that are served with a content hash in their name
+ASSETS = ("script.js", "style.css")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class Asset(NamedTuple):
+    name: str
+    content_type: str
+    data: bytes
+
+
+def fingerprint(name: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:16]}{ext}"
+
+
+@lru_cache(maxsize=None)
+def get_assets() -> Mapping[str, Asset]:
+    """
+    Read and hash the assets once. The fingerprinted names are served from
+    the bytes that were hashed, so that they can never change, even if the
+    files are rebuilt while the server is running.
+    """
+    assets = {}  # type: Dict[str, Asset]
+    for name in ASSETS:
+        try:
+            data = importlib.resources.read_binary(resources, name)
+        except FileNotFoundError:
+            continue
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        assets[name] = Asset(fingerprint(name, data), content_type, data)
+    return assets
+
+
+def get_manifest() -> Mapping[str, str]:
+    """Map each asset to its fingerprinted name, if it exists."""
+    assets = get_assets()
+    return {name: assets[name].name if name in assets else name for name in ASSETS}
@@ -0,0 +1,140 @@
+"""
+aquaorder
+Copyright (C) 2022  schnusch
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+import sys
+from itertools import cycle
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union, cast
+
+from .types import ArticleChoices
+
+
+def format_size(size: Union[None, int, float, str]) -> str:
+    if not size:
+        return ""
+    figspace = "\u2007"
+    parts = [x.strip() for x in str(size).rsplit("x", 2)]
+    m = re.match(r"^(\d+)(?:[.,](\d+))?$", parts[-1])
+    if m:
+        if len(parts) == 1:
+            parts.insert(0, "1")
+        parts[-1] = m[1].rjust(2, figspace)
+        parts[-1] += (("," + m[2]) if m[2] else "\u2008").ljust(3, figspace)
+    if len(parts) > 1:
+        parts[-2] = parts[-2].rjust(2, figspace)
+    return " \u00d7 ".join(parts)
+
+
+class ArticleVariant:
+    """One supplier's offer for an article row."""
+
+    __slots__ = ("supplier", "id", "name", "size", "formatted_size")
+
+    def __init__(
+        self,
+        supplier: str,
+        id: str,
+        name: str,
+        size: str,
+        formatted_size: str,
+    ):
+        self.supplier = supplier
+        self.id = id
+        self.name = name
+        self.size = size
+        self.formatted_size = formatted_size
+
+
+class ArticleRow:
+    """
+    A single orderable line of the index page, i.e. one `ArticleChoices`
+    with its form index and the supplier variants in document order.
+    """
+
+    __slots__ = ("index", "variants", "hint", "rowspan")
+
+    def __init__(
+        self, index: int, variants: Tuple[ArticleVariant, ...], hint: Optional[str]
+    ):
+        self.index = index
+        self.variants = variants
+        self.hint = hint
+        # the amount cell also spans the hint row
+        self.rowspan = len(variants) + (hint is not None)
+
+
+class ArticleCatalog:
+    """
+    Immutable, flattened view of the articles file that is built once per
+    load and shared by the index pages of all tenants using it.
+    """
+
+    __slots__ = ("sections", "rows", "suppliers", "__weakref__")
+
+    def __init__(self, sections: Iterable[List[ArticleChoices]]):
+        rows = []  # type: List[ArticleRow]
+        bounds = []  # type: List[Tuple[int, int]]
+        suppliers = {}  # type: Dict[str, str]
+        for section in sections:
+            start = len(rows)
+            for article_choices in section:
+                variants = []
+                hint = None  # type: Optional[str]
+                for supplier, article in article_choices.items():
+                    if isinstance(article, dict):
+                        supplier = suppliers.setdefault(supplier, sys.intern(supplier))
+                        size = article.get("size")
+                        variants.append(
+                            ArticleVariant(
+                                supplier=supplier,
+                                id=str(article.get("id", "")),
+                                name=article["name"],
+                                size="" if size is None else str(size),
+                                formatted_size=format_size(size),
+                            )
+                        )
+                    elif supplier == "hint":
+                        hint = cast(str, article)
+                rows.append(ArticleRow(len(rows), tuple(variants), hint))
+            bounds.append((start, len(rows)))
+        self.rows = tuple(rows)  # type: Tuple[ArticleRow, ...]
+        self.sections = tuple(
+            self.rows[start:end] for start, end in bounds
+        )  # type: Tuple[Tuple[ArticleRow, ...], ...]
+        self.suppliers = dict(
+            zip(sorted(suppliers), cycle(["#ffdfdf", "#dfdfff", "#dfffdf"]))
+        )  # type: Mapping[str, str]
+
+    def memory_size(self) -> int:
+        """Approximate memory used by the catalog, shared objects count once."""
+        seen = set()  # type: Set[int]
+        size = 0
+        objects = [self, self.rows, self.sections, self.suppliers]  # type: List[object]
+        objects.extend(self.sections)
+        objects.extend(self.suppliers)
+        objects.extend(self.suppliers.values())
+        for row in self.rows:
+            objects.extend((row, row.variants, row.hint))
+            for variant in row.variants:
+                objects.extend(getattr(variant, slot) for slot in variant.__slots__)
+                objects.append(variant)
+        for x in objects:
+            if id(x) not in seen:
+                seen.add(id(x))
+                size += sys.getsizeof(x)
+        return size
@@ -0,0 +1,107 @@
+"""
+aquaorder
+Copyright (C) 2022  schnusch
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, Callable, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from yaml import Mark, MarkedYAMLError  # type: ignore
+from yaml import load_all as yaml_load_all
+
+try:
+    from yaml import CLoader as YamlLoader
+except ImportError:
+    from yaml import Loader as YamlLoader  # type: ignore
+
+Validator = Callable[[Any], None]
+
+
+class DocumentError(ValueError):
+    pass
+
+
+def split_documents(fp: TextIO) -> Iterator[Tuple[int, str]]:
+    """
+    Split a YAML stream at its `---` markers and yield each document's text
+    together with the line number it starts at.
+
+    Streams using directives or `...` markers are yielded as a single chunk.
+    """
+    lines = fp.readlines()
+    if any(line.startswith(("%", "...")) for line in lines):
+        yield (1, "".join(lines))
+        return
+    start = 0
+    for i, line in enumerate(lines):
+        if i > start and re.match(r"^---(?:\s|$)", line):
+            yield (start + 1, "".join(lines[start:i]))
+            start = i
+    if start < len(lines):
+        yield (start + 1, "".join(lines[start:]))
+
+
+def move_mark(mark: Optional[Mark], name: str, lineno: int) -> Optional[Mark]:
+    if mark is None:
+        return None
+    return Mark(name, mark.index, mark.line + lineno - 1, mark.column, None, 0)
+
+
+def load_documents(validate: Validator, name: str, lineno: int, text: str) -> List[Any]:
+    """
+    Parse and validate the documents in `text`. This is run in worker
+    processes, so errors are flattened into a `DocumentError` that points at
+    the line in the original file.
+    """
+    try:
+        documents = list(yaml_load_all(text, Loader=YamlLoader))
+    except MarkedYAMLError as e:
+        e.context_mark = move_mark(e.context_mark, name, lineno)
+        e.problem_mark = move_mark(e.problem_mark, name, lineno)
+        raise DocumentError(str(e))
+    for document in documents:
+        try:
+            validate(document)
+        except Exception as e:
+            raise DocumentError(
+                f'in "{name}", document starting at line {lineno}: '
+                f"{type(e).__name__}: {getattr(e, 'message', e)}"
+            )
+    return documents
+
+
+def iter_documents(
+    fp: TextIO, validate: Validator, executor: Optional[Executor] = None
+) -> Iterator[Any]:
+    """
+    Yield the validated documents of `fp` in order. If `executor` is given the
+    documents are parsed in parallel and yielded as soon as they and all
+    documents before them are ready.
+    """
+    load = partial(load_documents, validate, fp.name)
+    if executor is None:
+        results = (
+            load(lineno, text) for lineno, text in split_documents(fp)
+        )  # type: Iterable[List[Any]]
+    else:
+        chunks = list(split_documents(fp))
+        results = executor.map(
+            load, [lineno for lineno, _ in chunks], [text for _, text in chunks]
+        )
+    for documents in results:
+        yield from documents
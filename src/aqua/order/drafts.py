@@ -0,0 +1,174 @@
+"""
+aquaorder
+Copyright (C) 2022  schnusch
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from functools import partial
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+from .pdf import BuildDirectoryPool, create_order_pdf
+from .tracing import current_trace
+from .types import OrderArticle, SupplierInfo
+
+
+def order_key(articles: List[OrderArticle], date: str, info: SupplierInfo) -> str:
+    data = json.dumps([articles, date, info], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class PDFRenderer:
+    """
+    Renders order PDFs and keeps the most recent ones. Drafts of the order
+    form are rendered speculatively at low priority, so that submitting an
+    unchanged draft can be answered from the cache.
+
+    Several renderers can share a build directory pool and the semaphore that
+    limits speculative renders, while each keeps its own cache.
+    """
+
+    def __init__(
+        self,
+        pool: Optional[BuildDirectoryPool] = None,
+        max_cached: int = 32,
+        max_cached_bytes: Optional[int] = None,
+        max_drafts: int = 64,
+        max_pending: int = 8,
+        speculative: Optional[asyncio.Semaphore] = None,
+    ):
+        self.pool = pool
+        self.max_cached = max_cached
+        self.max_cached_bytes = max_cached_bytes
+        self.max_drafts = max_drafts
+        self.max_pending = max_pending
+        self.cached = OrderedDict()  # type: OrderedDict[str, bytes]
+        self.cached_bytes = 0
+        self.pending = {}  # type: Dict[str, asyncio.Task[bytes]]
+        self.claimed = set()  # type: Set[str]
+        # speculative renders that are past the semaphore
+        self.running = set()  # type: Set[str]
+        self.drafts = OrderedDict()  # type: OrderedDict[str, Set[str]]
+        self.speculative = (
+            asyncio.Semaphore(1) if speculative is None else speculative
+        )  # type: asyncio.Semaphore
+
+    def store(self, key: str, pdf: bytes) -> None:
+        self.cached_bytes += len(pdf) - len(self.cached.get(key, b""))
+        self.cached[key] = pdf
+        self.cached.move_to_end(key)
+        while self.cached and (
+            len(self.cached) > self.max_cached
+            or (
+                self.max_cached_bytes is not None
+                and self.cached_bytes > self.max_cached_bytes
+            )
+        ):
+            _, evicted = self.cached.popitem(last=False)
+            self.cached_bytes -= len(evicted)
+
+    async def _render(
+        self, key: str, articles: List[OrderArticle], date: str, info: SupplierInfo
+    ) -> bytes:
+        # the task copied the context of the draft request, whose trace has
+        # been logged already
+        current_trace.set(None)
+        async with self.speculative:
+            self.running.add(key)
+            try:
+                async with create_order_pdf(
+                    articles, date, info, niceness=19, pool=self.pool
+                ) as fp:
+                    pdf = fp.read()
+            finally:
+                self.running.discard(key)
+        self.store(key, pdf)
+        return pdf
+
+    def _done(self, key: str, task: "asyncio.Task[bytes]") -> None:
+        if self.pending.get(key) is task:
+            del self.pending[key]
+        if not task.cancelled():
+            # retrieve the exception, the final render will report it
+            task.exception()
+
+    async def render(
+        self, articles: List[OrderArticle], date: str, info: SupplierInfo
+    ) -> bytes:
+        key = order_key(articles, date, info)
+        try:
+            self.cached.move_to_end(key)
+            return self.cached[key]
+        except KeyError:
+            pass
+
+        task = self.pending.get(key)
+        if task is not None and key not in self.running:
+            # still queued behind other speculative renders, rendering at
+            # normal priority right away is faster
+            task.cancel()
+            del self.pending[key]
+        elif task is not None:
+            self.claimed.add(key)
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+            except Exception:
+                # speculative renders are best effort, retry below
+                pass
+            finally:
+                self.claimed.discard(key)
+
+        async with create_order_pdf(articles, date, info, pool=self.pool) as fp:
+            pdf = fp.read()
+        self.store(key, pdf)
+        return pdf
+
+    def speculate(
+        self,
+        draft: str,
+        orders: Mapping[str, Tuple[List[OrderArticle], SupplierInfo]],
+        date: str,
+    ) -> None:
+        keys = {
+            order_key(articles, date, info): (articles, info)
+            for articles, info in orders.values()
+        }
+
+        self.drafts[draft] = set(keys)
+        self.drafts.move_to_end(draft)
+        while len(self.drafts) > self.max_drafts:
+            self.drafts.popitem(last=False)
+
+        # cancel renders that no draft asks for anymore
+        wanted = self.claimed.union(*self.drafts.values())
+        for key, task in list(self.pending.items()):
+            if key not in wanted:
+                task.cancel()
+                del self.pending[key]
+
+        # bound the queued renders, no matter how many drafts a client opens
+        for key, (articles, info) in keys.items():
+            if len(self.pending) >= self.max_pending:
+                break
+            if key not in self.cached and key not in self.pending:
+                task = asyncio.ensure_future(self._render(key, articles, date, info))
+                task.add_done_callback(partial(self._done, key))
+                self.pending[key] = task
@@ -0,0 +1,69 @@
+"""
+aquaorder
+Copyright (C) 2022  schnusch
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import csv
+import io
+import json
+from typing import Iterator, List
+
+from .types import OrderArticle, SupplierInfo
+
+CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "csv": "text/csv",
+    "json": "application/json",
+}
+
+
+def iter_order_csv(articles: List[OrderArticle]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["id", "name", "size", "amount"])
+    for article in articles:
+        writer.writerow(
+            [
+                article.get("id", ""),
+                article["name"],
+                article.get("size", ""),
+                article["amount"],
+            ]
+        )
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    # only a header if there are no articles
+    yield buf.getvalue()
+
+
+def iter_order_json(
+    articles: List[OrderArticle], date: str, info: SupplierInfo
+) -> Iterator[str]:
+    yield json.dumps(
+        {
+            "supplier": info["name"],
+            "customer_id": info["customer_id"],
+            "date": date,
+        },
+        ensure_ascii=False,
+    )[:-1]
+    yield ', "articles": ['
+    for i, article in enumerate(articles):
+        if i > 0:
+            yield ", "
+        yield json.dumps(article, ensure_ascii=False)
+    yield "]}\n"
@@ -17,30 +17,16 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import importlib.resources
-import re
-from itertools import cycle
-from typing import Callable, List, Mapping, Optional, Tuple, Union
+import weakref
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
 
 import jinja2
 
 from . import resources
-from .types import ArticleChoices
-
-
-def format_size(size: Union[None, int, float, str]) -> str:
-    if not size:
-        return ""
-    figspace = "\u2007"
-    parts = [x.strip() for x in str(size).rsplit("x", 2)]
-    m = re.match(r"^(\d+)(?:[.,](\d+))?$", parts[-1])
-    if m:
-        if len(parts) == 1:
-            parts.insert(0, "1")
-        parts[-1] = m[1].rjust(2, figspace)
-        parts[-1] += (("," + m[2]) if m[2] else "\u2008").ljust(3, figspace)
-    if len(parts) > 1:
-        parts[-2] = parts[-2].rjust(2, figspace)
-    return " \u00D7 ".join(parts)
+from .assets import get_manifest
+from .catalog import ArticleCatalog
+from .tracing import traced
 
 
 class ImportlibLoader(jinja2.BaseLoader):
@@ -51,41 +37,42 @@ class ImportlibLoader(jinja2.BaseLoader):
         return (source, None, lambda: True)
 
 
-loader = ImportlibLoader()
-environment = jinja2.Environment(
-    enable_async=True,
-    loader=loader,
-    auto_reload=True,
-    autoescape=True,
-)
-environment.globals.update(
-    {
-        "format_size": format_size,
-        "isinstance": isinstance,
-        "len": len,
-        "sorted": sorted,
-        "title": "aquaorder",
-    }
-)
-
-
-def get_all_suppliers(articles: List[List[ArticleChoices]]) -> Mapping[str, str]:
-    suppliers = {}
-    for section in articles:
-        for article_choices in section:
-            for supplier, article in article_choices.items():
-                if isinstance(article, dict):
-                    suppliers[supplier] = ""
-    for supplier, color in zip(
-        sorted(suppliers), cycle(["#ffdfdf", "#dfdfff", "#dfffdf"])
-    ):
-        suppliers[supplier] = color
-    return suppliers
-
-
-async def index(articles: List[List[ArticleChoices]]) -> bytes:
-    return (
-        await environment.get_template("index.html").render_async(
-            articles=articles, suppliers=get_all_suppliers(articles)
+@lru_cache(maxsize=None)
+def get_environment() -> jinja2.Environment:
+    environment = jinja2.Environment(
+        enable_async=True,
+        loader=ImportlibLoader(),
+        auto_reload=True,
+        autoescape=True,
+    )
+    environment.globals.update(
+        {
+            "assets": get_manifest(),
+            "sorted": sorted,
+            "title": "aquaorder",
+        }
+    )
+    return environment
+
+
+# rendered pages only depend on the catalog, so they can be shared by every
+# tenant that uses it and are dropped together with it
+rendered = (
+    weakref.WeakKeyDictionary()
+)  # type: weakref.WeakKeyDictionary[ArticleCatalog, bytes]
+
+
+@traced("html.index")
+async def index(catalog: ArticleCatalog) -> bytes:
+    try:
+        return rendered[catalog]
+    except KeyError:
+        pass
+    template = get_environment().get_template("index.html")
+    body = (
+        await template.render_async(
+            articles=catalog.sections, suppliers=catalog.suppliers
         )
     ).encode("utf-8")
+    rendered[catalog] = body
+    return body
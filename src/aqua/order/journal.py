@@ -0,0 +1,229 @@
+"""
+aquaorder
+Copyright (C) 2022  schnusch
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+from .types import OrderArticle, SupplierInfo
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    tenant TEXT NOT NULL,
+    supplier TEXT NOT NULL,
+    date TEXT NOT NULL,
+    created REAL NOT NULL,
+    articles TEXT NOT NULL,
+    info TEXT NOT NULL
+);
+-- listing walks a tenant's orders by descending id
+CREATE INDEX IF NOT EXISTS orders_tenant_id ON orders (tenant, id);
+DROP INDEX IF EXISTS orders_tenant_created;
+DROP INDEX IF EXISTS orders_tenant_supplier_date;
+"""
+
+
+class JournalEntry(NamedTuple):
+    id: int
+    supplier: str
+    date: str
+    created: float
+    articles: List[OrderArticle]
+    info: SupplierInfo
+
+
+Row = Tuple[str, str, str, float, str, str]
+
+# SQLite's integers are 64 bit
+MAX_ID = (1 << 63) - 1
+MAX_LIMIT = 1000
+
+
+class OrderJournal:
+    """
+    Records orders in an SQLite database. Orders are queued and written by a
+    background task in batches, so recording one never waits on the disk.
+    All database access happens on a single thread.
+    """
+
+    def __init__(self, path: str, max_queued: int = 1024, max_batch: int = 128):
+        self.path = path
+        self.max_batch = max_batch
+        # None stops the writer
+        self.queue = asyncio.Queue(max_queued)  # type: asyncio.Queue[Optional[Row]]
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="journal")
+        self.db = None  # type: Optional[sqlite3.Connection]
+        self.writer = None  # type: Optional[asyncio.Task[None]]
+
+    async def run(self, func: Any, *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, func, *args
+        )
+
+    def _open(self) -> None:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+        self.db = db
+
+    def _close(self) -> None:
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _write(self, rows: List[Row]) -> None:
+        assert self.db is not None
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO orders (tenant, supplier, date, created, articles, info)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    async def __aenter__(self) -> "OrderJournal":
+        await self.run(self._open)
+        self.writer = asyncio.ensure_future(self._writer())
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        if self.writer is not None:
+            # let the writer finish its batches instead of cancelling it, a
+            # cancelled write may not have started yet
+            await self.queue.put(None)
+            await self.writer
+        # write what was recorded after the writer stopped
+        rows = []
+        while not self.queue.empty():
+            row = self.queue.get_nowait()
+            if row is not None:
+                rows.append(row)
+        if rows:
+            await self.run(self._write, rows)
+        await self.run(self._close)
+        self.executor.shutdown()
+
+    async def _writer(self) -> None:
+        stopped = False
+        while not stopped:
+            rows = []  # type: List[Row]
+            row = await self.queue.get()
+            while row is not None:
+                rows.append(row)
+                if len(rows) >= self.max_batch or self.queue.empty():
+                    break
+                row = self.queue.get_nowait()
+            stopped = row is None
+            if not rows:
+                continue
+            try:
+                await self.run(self._write, rows)
+            except Exception:
+                logging.getLogger(__name__).exception(
+                    "failed to journal %d orders", len(rows)
+                )
+
+    def record(
+        self,
+        tenant: str,
+        supplier: str,
+        date: str,
+        articles: List[OrderArticle],
+        info: SupplierInfo,
+    ) -> None:
+        row = (
+            tenant,
+            supplier,
+            date,
+            time.time(),
+            json.dumps(articles, ensure_ascii=False),
+            json.dumps(info, ensure_ascii=False),
+        )
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            logging.getLogger(__name__).error(
+                "journal queue is full, dropping order for %s", supplier
+            )
+
+    def _list(
+        self, tenant: str, limit: int, before: Optional[int]
+    ) -> List[Tuple[int, str, str, float, int]]:
+        assert self.db is not None
+        return self.db.execute(
+            "SELECT id, supplier, date, created, json_array_length(articles)"
+            " FROM orders WHERE tenant = ? AND id < ?"
+            " ORDER BY id DESC LIMIT ?",
+            (tenant, MAX_ID if before is None else before, limit),
+        ).fetchall()
+
+    async def list(
+        self, tenant: str, limit: int = 100, before: Optional[int] = None
+    ) -> List[Tuple[int, str, str, float, int]]:
+        """
+        Return `(id, supplier, date, created, number of articles)` of the
+        most recent orders, orders still queued are not included. `limit` is
+        clamped to 1 to `MAX_LIMIT`.
+        """
+        limit = max(1, min(limit, MAX_LIMIT))
+        return await self.run(self._list, tenant, limit, before)
+
+    def _get(self, tenant: str, id: int) -> Optional[JournalEntry]:
+        assert self.db is not None
+        row = self.db.execute(
+            "SELECT id, supplier, date, created, articles, info"
+            " FROM orders WHERE tenant = ? AND id = ?",
+            (tenant, id),
+        ).fetchone()
+        if row is None:
+            return None
+        id, supplier, date, created, articles, info = row
+        return JournalEntry(
+            id, supplier, date, created, json.loads(articles), json.loads(info)
+        )
+
+    async def get(self, tenant: str, id: int) -> Optional[JournalEntry]:
+        if not 0 < id <= MAX_ID:
+            return None
+        return await self.run(self._get, tenant, id)
+
+
+class TenantJournal:
+    """The part of an `OrderJournal` that belongs to a single tenant."""
+
+    def __init__(self, journal: OrderJournal, tenant: str):
+        self.journal = journal
+        self.tenant = tenant
+
+    def record(
+        self, supplier: str, date: str, articles: List[OrderArticle], info: SupplierInfo
+    ) -> None:
+        self.journal.record(self.tenant, supplier, date, articles, info)
+
+    async def list(
+        self, limit: int = 100, before: Optional[int] = None
+    ) -> List[Tuple[int, str, str, float, int]]:
+        return await self.journal.list(self.tenant, limit, before)
+
+    async def get(self, id: int) -> Optional[JournalEntry]:
+        return await self.journal.get(self.tenant, id)
@@ -19,13 +19,26 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import asyncio
 import os.path
 import re
+import shutil
+import signal
 import subprocess
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
 from functools import partial
-from tempfile import TemporaryDirectory
-from typing import AsyncIterator, BinaryIO, List, TextIO
+from tempfile import TemporaryDirectory, mkdtemp
+from typing import (
+    Any,
+    AsyncIterator,
+    BinaryIO,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    TextIO,
+)
 
-from .html import format_size
+from .catalog import format_size
+from .tracing import traced
 from .types import OrderArticle, SupplierInfo
 
 
@@ -39,7 +52,7 @@ def _tex_escape(m: re.Match) -> str:
             "\\": r"{\textbackslash}",
             "₂": r"\textsubscript{2}",
             "\n": "\\\\\n",
-            "\u00D7": r"{\texttimes}",
+            "\u00d7": r"{\texttimes}",
             "\u2007": r"\phantom{0}",
             "\u2008": r"\phantom{,}",
         }[badchar]
@@ -50,14 +63,14 @@ def _tex_escape(m: re.Match) -> str:
 tex_escape = partial(re.compile(r"[&%$#_{}~^\\₂\n\u00D7\u2007\u2008]").sub, _tex_escape)
 
 
+@traced("write_order_tex")
 def write_order_tex(
     fp: TextIO,
     articles: List[OrderArticle],
     date: str,
     info: SupplierInfo,
 ) -> None:
-    fp.write(
-        r"""\documentclass[a4paper,oneside,11pt]{article}
+    fp.write(r"""\documentclass[a4paper,oneside,11pt]{article}
 \usepackage[
     top=15mm,
     left=20mm,
@@ -70,38 +83,28 @@ def write_order_tex(
 \setlength{\parskip}{1em}
 \setlength{\parindent}{0em}
 \begin{document}
-\textbf{"""
-    )
+\textbf{""")
     fp.write(tex_escape(info["name"]))
-    fp.write(
-        r"""}
+    fp.write(r"""}
 
-"""
-    )
+""")
     fp.write(tex_escape(info["from_address"]))
-    fp.write(
-        r"""
+    fp.write(r"""
 
-St.-Nr.: """
-    )
+St.-Nr.: """)
     fp.write(tex_escape(info["tax_id"]))
-    fp.write(
-        r"""\\
-Kd.-Nr.: """
-    )
+    fp.write(r"""\\
+Kd.-Nr.: """)
     fp.write(tex_escape(str(info["customer_id"])))
-    fp.write(
-        r"""
+    fp.write(r"""
 
-"""
-    )
+""")
     fp.write(tex_escape(info["from_name"]))
     fp.write(": ")
     fp.write(tex_escape(info["from_phone"]))
     fp.write(r"""\hfill Lieferdatum: """)
     fp.write(tex_escape(date))
-    fp.write(
-        r"""
+    fp.write(r"""
 
 \begin{center}
     \begin{longtable}{c l c c}
@@ -109,8 +112,7 @@ Kd.-Nr.: """
         \textbf{Artikel-Nr.} & \textbf{Artikel} & \textbf{Gebinde} & \textbf{Menge} \\
         \hline
     \endhead
-"""
-    )
+""")
     for article in articles:
         fp.write(r"        ")
         fp.write(tex_escape(article.get("id", "")))
@@ -120,58 +122,169 @@ Kd.-Nr.: """
         fp.write(tex_escape(format_size(article.get("size"))))
         fp.write(r" & ")
         fp.write(tex_escape(article["amount"]))
-        fp.write(
-            r""" \\
-"""
-        )
-    fp.write(
-        r"""        \hline
+        fp.write(r""" \\
+""")
+    fp.write(r"""        \hline
     \end{longtable}
 \end{center}
 
 Mit freundlichen Grüßen\\
-"""
-    )
+""")
     fp.write(tex_escape(info["from_name"]))
-    fp.write(
-        r"""
+    fp.write(r"""
 \end{document}
-"""
-    )
+""")
+
+
+def kill_process_group(pgid: int, sig: int) -> None:
+    try:
+        os.killpg(pgid, sig)
+    except ProcessLookupError:
+        pass
 
 
-async def run_latex(dir: str, name: str, timeout: int = 30) -> None:
+@traced("run_latex")
+async def run_latex(
+    dir: str,
+    name: str,
+    timeout: int = 30,
+    niceness: int = 0,
+    env: Optional[Mapping[str, str]] = None,
+) -> None:
+    args = ["latexmk", name]
+    if niceness:
+        # applied before exec, so that latexmk's children inherit it
+        args = ["nice", "-n", str(niceness)] + args
     with open(os.path.join(dir, ".log"), "x+b") as fp:
+        # a session of its own, so that the TeX engines latexmk started can
+        # be killed along with it
         proc = await asyncio.create_subprocess_exec(
-            "latexmk", name, cwd=dir, stdin=subprocess.DEVNULL, stdout=fp, stderr=fp
+            *args,
+            cwd=dir,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=fp,
+            stderr=fp,
+            start_new_session=True,
         )
         try:
             await asyncio.wait_for(proc.wait(), timeout)
-        except asyncio.TimeoutError:
-            proc.terminate()
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            kill_process_group(proc.pid, signal.SIGTERM)
             try:
                 await asyncio.wait_for(proc.wait(), timeout=1)
             except asyncio.TimeoutError:
-                proc.kill()
+                pass
+            # children that outlived latexmk are still in its process group
+            kill_process_group(proc.pid, signal.SIGKILL)
+            await proc.wait()
             raise
         if proc.returncode != 0:
             fp.seek(0)
             raise ChildProcessError(fp.read().decode("utf-8", "surrogateescape"))
 
 
+def write_latexmkrc(dir: str) -> None:
+    with open(os.path.join(dir, ".latexmkrc"), "x", encoding="utf-8") as fp:
+        fp.write(r"""$pdf_mode = 5;
+""")
+
+
+class BuildDirectoryPool:
+    """
+    Build directories that are reused across renders, so that the TeX and
+    font caches stay warm. Every directory is leased to a single render at a
+    time.
+
+    Of the previous render only `order.aux` is kept, it holds the column
+    widths longtable settled on, which usually saves a LaTeX run. Everything
+    else, like the `.xdv` with the whole previous order, is removed, as the
+    pool is shared between tenants.
+    """
+
+    kept_files = ("order.aux",)
+
+    def __init__(self, base: Optional[str] = None, max_idle: int = 4):
+        self.tmp = TemporaryDirectory(prefix="aquaorder-", dir=base)
+        self.max_idle = max_idle
+        self.idle = []  # type: List[str]
+        cache = os.path.join(self.tmp.name, "cache")
+        self.env = dict(
+            os.environ,
+            TEXMFVAR=os.path.join(cache, "texmf-var"),
+            XDG_CACHE_HOME=cache,
+        )  # type: Mapping[str, str]
+
+    def __enter__(self) -> "BuildDirectoryPool":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.idle.clear()
+        self.tmp.cleanup()
+
+    def create(self) -> str:
+        dir = mkdtemp(prefix="build-", dir=self.tmp.name)
+        write_latexmkrc(dir)
+        return dir
+
+    def clean(self, dir: str, keep: Iterable[str] = ()) -> None:
+        for name in os.listdir(dir):
+            if name != ".latexmkrc" and name not in keep:
+                path = os.path.join(dir, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.unlink(path)
+
+    def release(self, dir: str, keep: Iterable[str] = ()) -> None:
+        if len(self.idle) < self.max_idle:
+            self.clean(dir, keep)
+            self.idle.append(dir)
+        else:
+            shutil.rmtree(dir, ignore_errors=True)
+
+    @contextmanager
+    def lease(self) -> Iterator[str]:
+        dir = self.idle.pop() if self.idle else self.create()
+        try:
+            yield dir
+        except asyncio.CancelledError:
+            # latexmk has been killed, but its files may be incomplete
+            self.release(dir)
+            raise
+        except BaseException:
+            # the state of a failed build cannot be trusted
+            shutil.rmtree(dir, ignore_errors=True)
+            raise
+        self.release(dir, self.kept_files)
+
+
+@contextmanager
+def temporary_build_directory() -> Iterator[str]:
+    with TemporaryDirectory() as tmp:
+        write_latexmkrc(tmp)
+        yield tmp
+
+
 @asynccontextmanager
 async def create_order_pdf(
-    articles: List[OrderArticle], date: str, info: SupplierInfo
+    articles: List[OrderArticle],
+    date: str,
+    info: SupplierInfo,
+    niceness: int = 0,
+    pool: Optional[BuildDirectoryPool] = None,
 ) -> AsyncIterator[BinaryIO]:
-    with TemporaryDirectory() as tmp:
-        with open(os.path.join(tmp, ".latexmkrc"), "x", encoding="utf-8") as fp:
-            fp.write(
-                r"""$pdf_mode = 5;
-$go_mode = 1;
-"""
-            )
-        with open(os.path.join(tmp, "order.tex"), "x", encoding="utf-8") as fp:
+    with temporary_build_directory() if pool is None else pool.lease() as dir:
+        with open(os.path.join(dir, "order.tex"), "x", encoding="utf-8") as fp:
             write_order_tex(fp, articles, date, info)
-        await run_latex(tmp, "order.tex")
-        with open(os.path.join(tmp, "order.pdf"), "rb") as fp:
+        await run_latex(
+            dir,
+            "order.tex",
+            niceness=niceness,
+            env=None if pool is None else pool.env,
+        )
+        with open(os.path.join(dir, "order.pdf"), "rb") as fp:
             yield fp
@@ -0,0 +1,96 @@
+"""
+aquaorder
+Copyright (C) 2022  schnusch
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import importlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, TextIO, Tuple
+
+# imported lazily by the web server
+HEAVY_MODULES = ("yaml", "jsonschema", "jinja2")
+
+
+def process_uptime() -> Optional[float]:
+    """Seconds since the process was started, if it can be determined."""
+    try:
+        with open("/proc/self/stat", "rb") as fp:
+            stat = fp.read()
+        # the command name may contain spaces and parentheses
+        starttime = int(stat.rsplit(b")", 1)[1].split()[19])
+        boottime = time.clock_gettime(time.CLOCK_BOOTTIME)
+        return boottime - starttime / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class StartupProfile:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        # interpreter start-up and the imports of the entry point
+        self.initial = process_uptime() if enabled else None
+        self.timings = []  # type: List[Tuple[str, str, float]]
+
+    def add(self, name: str, start: float) -> None:
+        """Record `name` as having taken from `start` until now."""
+        if self.enabled:
+            self.timings.append(
+                (threading.current_thread().name, name, time.perf_counter() - start)
+            )
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start)
+
+    def import_module(self, name: str) -> None:
+        if name not in sys.modules:
+            with self.measure(f"import {name}"):
+                importlib.import_module(name)
+
+    def report(self, fp: TextIO = sys.stderr) -> None:
+        if not self.enabled:
+            return
+        uptime = process_uptime()
+        if uptime is not None:
+            print(f"{uptime * 1000:9.1f} ms  total since process start", file=fp)
+        if self.initial is not None:
+            print(
+                f"{self.initial * 1000:9.1f} ms  interpreter and eager imports", file=fp
+            )
+        for thread, name, seconds in self.timings:
+            print(f"{seconds * 1000:9.1f} ms  {name} [{thread}]", file=fp)
+
+
+def warm_up(profile: StartupProfile) -> None:
+    """
+    Import the modules that are only needed to answer requests and compile
+    the templates. This is run in a thread while the sockets are set up.
+    """
+    for name in HEAVY_MODULES:
+        profile.import_module(name)
+    profile.import_module("aqua.order.html")
+    from . import html
+
+    with profile.measure("compile index.html"):
+        html.get_environment().get_template("index.html")
@@ -0,0 +1,211 @@
+"""
+aquaorder
+Copyright (C) 2022  schnusch
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import inspect
+import json
+import logging
+import os.path
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from types import FrameType
+from typing import Any, Awaitable, Callable, Iterator, List, Optional, Tuple, TypeVar
+
+from aiohttp import web
+from aiohttp.web_log import AccessLogger
+from aiohttp.web_request import BaseRequest
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+logger = logging.getLogger(__name__)
+
+
+class Trace:
+    def __init__(self, threshold: float = 0.0) -> None:
+        self.threshold = threshold
+        self.start = time.perf_counter()
+        self.spans = []  # type: List[Tuple[str, float, float]]
+
+    def to_json(self) -> List[Any]:
+        return [
+            {
+                "name": name,
+                "start_ms": round((start - self.start) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+            }
+            for name, start, duration in self.spans
+        ]
+
+
+TRACE_KEY = "aquaorder.trace"
+
+current_trace = ContextVar(
+    "current_trace", default=None
+)  # type: ContextVar[Optional[Trace]]
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append((name, start, time.perf_counter() - start))
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Record calls of the decorated function as a span of the current trace."""
+
+    def decorator(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper  # type: ignore
+
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+def tracing_middleware(threshold: float) -> Any:
+    """
+    Trace requests, those taking longer than `threshold` seconds are logged
+    with their spans by `TracingAccessLogger`.
+    """
+
+    @web.middleware
+    async def middleware(
+        request: web.Request,
+        handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+    ) -> web.StreamResponse:
+        trace = Trace(threshold)
+        request[TRACE_KEY] = trace
+        token = current_trace.set(trace)
+        try:
+            return await handler(request)
+        finally:
+            current_trace.reset(token)
+
+    return middleware
+
+
+class TracingAccessLogger(AccessLogger):
+    """
+    Access logger that also logs slow requests. It is called once the
+    response has been sent, so the status is final, e.g. of a `FileResponse`,
+    and sending the body is part of the duration.
+    """
+
+    @property
+    def enabled(self) -> bool:
+        return True
+
+    def log(
+        self, request: BaseRequest, response: web.StreamResponse, time: float
+    ) -> None:
+        if super().enabled:
+            super().log(request, response, time)
+        trace = request.get(TRACE_KEY)
+        if trace is None or time < trace.threshold:
+            return
+        logger.warning(
+            "%s",
+            json.dumps(
+                {
+                    "event": "slow_request",
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status,
+                    "duration_ms": round(time * 1000, 3),
+                    "spans": trace.to_json(),
+                }
+            ),
+        )
+
+
+def fold_stack(frame: Optional[FrameType]) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of another thread, usually the one running the event
+    loop, and writes it in the folded format understood by flamegraph.pl.
+    """
+
+    def __init__(self, directory: str, seconds: float, interval: float = 0.005):
+        self.directory = directory
+        self.seconds = seconds
+        self.interval = interval
+        self.thread = None  # type: Optional[threading.Thread]
+
+    def start(self, thread_id: Optional[int] = None) -> None:
+        if self.thread is not None and self.thread.is_alive():
+            logger.warning("sampling profiler is already running")
+            return
+        if thread_id is None:
+            thread_id = threading.get_ident()
+        self.thread = threading.Thread(
+            target=self.run, args=(thread_id,), name="profiler", daemon=True
+        )
+        self.thread.start()
+
+    def sample(self, thread_id: int) -> "Counter[str]":
+        stacks = Counter()  # type: Counter[str]
+        end = time.monotonic() + self.seconds
+        while time.monotonic() < end:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            stacks[fold_stack(frame)] += 1
+            del frame
+            time.sleep(self.interval)
+        return stacks
+
+    def run(self, thread_id: int) -> None:
+        logger.warning("sampling thread %d for %g seconds", thread_id, self.seconds)
+        stacks = self.sample(thread_id)
+        path = os.path.join(
+            self.directory, time.strftime("aquaorder-%Y%m%d-%H%M%S.folded")
+        )
+        with open(path, "w", encoding="utf-8") as fp:
+            for stack, count in stacks.most_common():
+                fp.write(f"{stack} {count}\n")
+        logger.warning("wrote %d samples to %s", sum(stacks.values()), path)
@@ -100,6 +100,7 @@ SupplierInfoSchema = {
         "from_address": {"type": "string"},
         "from_name": {"type": "string"},
         "from_phone": {"type": "string"},
+        "order_format": {"enum": ["pdf", "csv", "json"]},
     },
     "required": [
         "name",
@@ -112,10 +113,44 @@ SupplierInfoSchema = {
 }
 
 
-class SupplierInfo(TypedDict, total=True):
+class _SupplierInfo(TypedDict, total=True):
     name: str
     customer_id: Union[int, float, str]
     tax_id: str
     from_address: str
     from_name: str
     from_phone: str
+
+
+class SupplierInfo(_SupplierInfo, total=False):
+    order_format: str
+
+
+TenantInfoSchema = {
+    "type": "object",
+    "properties": {
+        "articles": {"type": "string"},
+        "suppliers": {"type": "string"},
+        "max_cached_pdfs": {"type": "integer", "minimum": 0},
+        "max_cached_pdf_bytes": {"type": "integer", "minimum": 0},
+    },
+    "required": ["articles", "suppliers"],
+    "additionalProperties": False,
+}
+
+TenantsSchema = {
+    "type": "object",
+    "propertyNames": {"pattern": "^[A-Za-z0-9_-]+$"},
+    "additionalProperties": TenantInfoSchema,
+    "minProperties": 1,
+}
+
+
+class _TenantInfo(TypedDict, total=True):
+    articles: str
+    suppliers: str
+
+
+class TenantInfo(_TenantInfo, total=False):
+    max_cached_pdfs: int
+    max_cached_pdf_bytes: int
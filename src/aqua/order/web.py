@@ -19,12 +19,19 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import argparse
 import asyncio
 import importlib.resources
+import json
+import logging
+import multiprocessing
 import os.path
 import pathlib
 import re
+import signal
 import socket
+import tempfile
+import time
 import weakref
-from contextlib import contextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import AsyncExitStack, ExitStack, contextmanager
 from functools import partial, reduce
 from typing import (
     Any,
@@ -32,9 +39,11 @@ from typing import (
     Dict,
     Final,
     Generic,
+    Iterable,
     Iterator,
     List,
     Mapping,
+    NamedTuple,
     Optional,
     Tuple,
     TypeVar,
@@ -42,24 +51,31 @@ from typing import (
     cast,
 )
 
-import jsonschema  # type: ignore
 from aiohttp import web
 from aiohttp.web_runner import AppRunner, BaseSite, SockSite, TCPSite, UnixSite
-from yaml import load_all as yaml_load_all  # type: ignore
 
-try:
-    from yaml import CLoader as YamlLoader
-except ImportError:
-    from yaml import Loader as YamlLoader
-
-from . import html, resources
-from .pdf import create_order_pdf
+from . import resources, startup
+from .assets import ASSETS, IMMUTABLE, Asset, get_assets
+from .catalog import ArticleCatalog
+from .drafts import PDFRenderer
+from .export import CONTENT_TYPES, iter_order_csv, iter_order_json
+from .journal import MAX_ID, OrderJournal, TenantJournal
+from .pdf import BuildDirectoryPool
+from .startup import StartupProfile
+from .tracing import (
+    SamplingProfiler,
+    TracingAccessLogger,
+    traced,
+    tracing_middleware,
+)
 from .types import (
     ArticleChoices,
     ArticleChoicesSchema,
     OrderArticle,
     SupplierInfo,
     SupplierInfoSchema,
+    TenantInfo,
+    TenantsSchema,
 )
 
 try:
@@ -92,54 +108,159 @@ else:
 
 
 T = TypeVar("T")
+R = TypeVar("R")
 
 
-class YAMLLoader(Generic[T]):
+class YAMLLoader(Generic[T, R]):
     class WeakList(list):
         pass
 
-    def __init__(self, name: str):
+    # keep the built result alive between requests instead of only while it
+    # is in use, only sensible if it is compact
+    keep_cached = False
+
+    def __init__(self, name: str, executor: Optional[Executor] = None):
         self.name = name  # type: Final[str]
+        self.executor = executor  # type: Final[Optional[Executor]]
         self.mtime = None  # type: Union[None, int, float]
-        self.get_cached = lambda: None  # type: Callable[[], Optional[List[T]]]
-
-    def validate(self, section: T) -> None:
+        self.get_cached = lambda: None  # type: Callable[[], Optional[R]]
+        self.loading = (
+            None
+        )  # type: Optional[Tuple[Union[int, float], asyncio.Future[R]]]
+
+    # validators are static so that they can be pickled to worker processes
+    @staticmethod
+    def validate(section: Any) -> None:
         pass
 
-    def __call__(self) -> List[T]:
-        sections = self.get_cached()
+    def build(self, sections: Iterable[T]) -> R:
+        raise NotImplementedError
+
+    def load(self) -> R:
+        from .documents import iter_documents
+
+        with open(self.name, "r", encoding="utf-8") as fp:
+            return self.build(
+                cast(T, section)
+                for section in iter_documents(fp, type(self).validate, self.executor)
+            )
+
+    @traced("YAMLLoader.__call__")
+    async def __call__(self) -> R:
+        loaded = self.get_cached()
         mtime = os.path.getmtime(self.name)
-        if sections is None or self.mtime is None or mtime > self.mtime:
-            sections = []
-            with open(self.name, "r", encoding="utf-8") as fp:
-                for section in yaml_load_all(fp, Loader=YamlLoader):
-                    self.validate(section)
-                    sections.append(cast(T, section))
-            self.get_cached = weakref.ref(self.WeakList(sections))
-            self.mtime = mtime
-        return sections
-
-
-class ArticleLoader(YAMLLoader[List[ArticleChoices]]):
-    def validate(self, section: Any) -> None:
-        assert isinstance(section, list)
+        if loaded is None or self.mtime is None or mtime > self.mtime:
+            # share a single reload between concurrent requests and keep the
+            # event loop responsive while parsing
+            if self.loading is None or self.loading[0] != mtime:
+                future = asyncio.get_running_loop().run_in_executor(None, self.load)
+                self.loading = (mtime, future)
+            future = self.loading[1]
+            try:
+                loaded = await asyncio.shield(future)
+            finally:
+                if self.loading is not None and self.loading[1] is future:
+                    self.loading = None
+            if self.mtime is None or mtime >= self.mtime:
+                if self.keep_cached:
+                    self.get_cached = lambda: loaded
+                else:
+                    self.get_cached = weakref.ref(loaded)
+                self.mtime = mtime
+        return loaded
+
+
+class ArticleLoader(YAMLLoader[List[ArticleChoices], ArticleCatalog]):
+    keep_cached = True
+
+    @staticmethod
+    def validate(section: Any) -> None:
+        import jsonschema  # type: ignore
+
+        if not isinstance(section, list):
+            raise ValueError("articles section must be a list")
         for article_choices in section:
             jsonschema.validate(article_choices, ArticleChoicesSchema)
 
+    def build(self, sections: Iterable[List[ArticleChoices]]) -> ArticleCatalog:
+        return ArticleCatalog(sections)
+
 
-class SupplierLoader(YAMLLoader[Mapping[str, SupplierInfo]]):
-    def validate(self, section: Any) -> None:
-        assert isinstance(section, dict)
+class SupplierLoader(
+    YAMLLoader[Mapping[str, SupplierInfo], List[Mapping[str, SupplierInfo]]]
+):
+    @staticmethod
+    def validate(section: Any) -> None:
+        import jsonschema
+
+        if not isinstance(section, dict):
+            raise ValueError("suppliers section must be a mapping")
         for supplier, supplier_info in section.items():
-            assert isinstance(supplier, str)
+            if not isinstance(supplier, str):
+                raise ValueError(f"supplier name {supplier!r} must be a string")
             jsonschema.validate(supplier_info, SupplierInfoSchema)
 
+    def build(
+        self, sections: Iterable[Mapping[str, SupplierInfo]]
+    ) -> List[Mapping[str, SupplierInfo]]:
+        return self.WeakList(sections)
+
+
+class Tenant(NamedTuple):
+    prefix: str
+    load_articles: ArticleLoader
+    load_suppliers: SupplierLoader
+    max_cached_pdfs: int = 32
+    max_cached_pdf_bytes: Optional[int] = None
+
+
+def validate_tenants(section: Any) -> None:
+    import jsonschema
+
+    jsonschema.validate(section, TenantsSchema)
+
+
+def load_tenants(name: str, executor: Optional[Executor] = None) -> List[Tenant]:
+    from .documents import iter_documents
+
+    with open(name, "r", encoding="utf-8") as fp:
+        documents = list(iter_documents(fp, validate_tenants))
+    if len(documents) != 1:
+        raise ValueError(f"{name} must contain exactly one document")
+    tenant_infos = cast(Mapping[str, TenantInfo], documents[0])
+
+    # tenants using the same files share their loaders and thus the catalogs
+    # and rendered pages
+    directory = os.path.dirname(os.path.abspath(name))
+    article_loaders = {}  # type: Dict[str, ArticleLoader]
+    supplier_loaders = {}  # type: Dict[str, SupplierLoader]
+    tenants = []
+    for prefix, info in tenant_infos.items():
+        articles = os.path.join(directory, info["articles"])
+        suppliers = os.path.join(directory, info["suppliers"])
+        if articles not in article_loaders:
+            article_loaders[articles] = ArticleLoader(articles, executor)
+        if suppliers not in supplier_loaders:
+            supplier_loaders[suppliers] = SupplierLoader(suppliers, executor)
+        tenants.append(
+            Tenant(
+                f"/{prefix}",
+                article_loaders[articles],
+                supplier_loaders[suppliers],
+                info.get("max_cached_pdfs", 32),
+                info.get("max_cached_pdf_bytes"),
+            )
+        )
+    return tenants
+
 
 async def index(
     load_articles: ArticleLoader, request: web.Request
 ) -> web.StreamResponse:
-    articles = load_articles()
-    body = await html.index(articles)
+    from . import html
+
+    catalog = await load_articles()
+    body = await html.index(catalog)
     return web.Response(body=body, headers={"Content-Type": "application/xhtml+xml"})
 
 
@@ -147,8 +268,17 @@ async def file(path: pathlib.Path, request: web.Request) -> web.StreamResponse:
     return web.FileResponse(path=path)
 
 
+async def asset(asset: Asset, request: web.Request) -> web.StreamResponse:
+    return web.Response(
+        body=asset.data,
+        content_type=asset.content_type,
+        headers={"Cache-Control": IMMUTABLE},
+    )
+
+
+@traced("get_structured_order_data")
 async def get_structured_order_data(
-    raw_data: Mapping[str, str]
+    raw_data: Mapping[str, str],
 ) -> Mapping[str, List[OrderArticle]]:
     data = {}  # type: Dict[str, List[OrderArticle]]
     for key, amount in raw_data.items():
@@ -158,11 +288,12 @@ async def get_structured_order_data(
         i = m[1]
         try:
             supplier = raw_data[f"{i}_supplier"]
+        except KeyError:
+            raise web.HTTPBadRequest(text=f"missing {i}_supplier")
+        try:
             name = raw_data[f"{i}_{supplier}_name"]
         except KeyError:
-            raise web.HTTPBadRequest(
-                text=f"missing {i}_supplier or {i}_{supplier}_name"
-            )
+            raise web.HTTPBadRequest(text=f"missing {i}_{supplier}_name")
 
         article = OrderArticle(name=name, amount=amount)
         data.setdefault(supplier, []).append(article)
@@ -178,8 +309,29 @@ async def get_structured_order_data(
     return data
 
 
+async def get_supplier_infos(load_suppliers: SupplierLoader) -> Dict[str, SupplierInfo]:
+    supplier_infos = reduce(
+        dict.__or__, await load_suppliers(), {}
+    )  # type: Dict[str, SupplierInfo]
+    return supplier_infos
+
+
+def get_order_format(tail: str, info: SupplierInfo) -> str:
+    """
+    An explicit extension in the URL takes precedence over the supplier's
+    preferred format.
+    """
+    format = os.path.splitext(tail)[1][1:]
+    if format in CONTENT_TYPES:
+        return format
+    return info.get("order_format", "pdf")
+
+
 async def order(
-    load_suppliers: SupplierLoader, request: web.Request
+    load_suppliers: SupplierLoader,
+    renderer: PDFRenderer,
+    journal: Optional[TenantJournal],
+    request: web.Request,
 ) -> web.StreamResponse:
     raw_data = cast(Mapping[str, str], await request.post())
     if not raw_data:
@@ -196,47 +348,260 @@ async def order(
     except KeyError:
         raise web.HTTPBadRequest(text=f"order for supplier {supplier} not found")
 
-    supplier_infos = reduce(
-        dict.__or__, load_suppliers(), {}
-    )  # type: Dict[str, SupplierInfo]
+    supplier_infos = await get_supplier_infos(load_suppliers)
     try:
         info = supplier_infos[supplier]
     except KeyError:
         raise web.HTTPBadRequest(text=f"supplier info for {supplier} not found")
 
-    async with create_order_pdf(order, date, info) as fp:
-        size = os.stat(fp.fileno()).st_size
-        resp = web.StreamResponse()
-        resp.content_type = "application/pdf"
-        resp.content_length = size
-        await resp.prepare(request)
-        while size > 0:
-            x = fp.read(max(64 * 1024, size))
-            if not x:
-                break
-            await resp.write(x)
-            size -= len(x)
-        await resp.write_eof()
-        return resp
+    format = get_order_format(request.match_info["tail"], info)
+    if format == "pdf":
+        pdf = await renderer.render(order, date, info)
+        if journal is not None:
+            journal.record(supplier, date, order, info)
+        return web.Response(
+            body=pdf,
+            content_type="application/pdf",
+            headers={"Content-Disposition": f'inline; filename="{supplier}.pdf"'},
+        )
+
+    # machine-readable orders are streamed without going through LaTeX
+    resp = web.StreamResponse()
+    resp.content_type = CONTENT_TYPES[format]
+    resp.charset = "utf-8"
+    resp.headers["Content-Disposition"] = f'inline; filename="{supplier}.{format}"'
+    await resp.prepare(request)
+    if format == "csv":
+        chunks = iter_order_csv(order)
+    else:
+        chunks = iter_order_json(order, date, info)
+    for chunk in chunks:
+        await resp.write(chunk.encode("utf-8"))
+    await resp.write_eof()
+    if journal is not None:
+        journal.record(supplier, date, order, info)
+    return resp
+
+
+async def draft(
+    load_suppliers: SupplierLoader,
+    renderer: PDFRenderer,
+    request: web.Request,
+) -> web.StreamResponse:
+    raw_data = cast(Mapping[str, str], await request.post())
+    try:
+        draft = raw_data["draft"]
+        date = raw_data["date"]
+    except KeyError:
+        raise web.HTTPBadRequest(text="missing draft or date")
+    if not date:
+        # the date is required, no order can be submitted with this draft
+        return web.Response(status=202)
+
+    orders = await get_structured_order_data(raw_data)
+    supplier_infos = await get_supplier_infos(load_suppliers)
+    renderer.speculate(
+        draft,
+        {
+            supplier: (order, supplier_infos[supplier])
+            for supplier, order in orders.items()
+            if supplier in supplier_infos
+            and supplier_infos[supplier].get("order_format", "pdf") == "pdf"
+        },
+        date,
+    )
+    return web.Response(status=202)
+
+
+async def log_stats(tenants: List[Tenant], renderers: List[PDFRenderer]) -> None:
+    from . import html
+
+    for tenant, renderer in zip(tenants, renderers):
+        try:
+            # the catalog and page may be shared with other tenants
+            catalog = await tenant.load_articles()
+        except Exception:
+            logging.getLogger(__name__).exception(
+                "cannot load articles of tenant %r", tenant.prefix
+            )
+            continue
+        page = html.rendered.get(catalog)
+        logging.getLogger(__name__).warning(
+            "%s",
+            json.dumps(
+                {
+                    "event": "tenant_stats",
+                    "tenant": tenant.prefix,
+                    "catalog_bytes": catalog.memory_size(),
+                    "page_bytes": None if page is None else len(page),
+                    "pdf_cache_entries": len(renderer.cached),
+                    "pdf_cache_bytes": renderer.cached_bytes,
+                    "pdf_cache_max_entries": renderer.max_cached,
+                    "pdf_cache_max_bytes": renderer.max_cached_bytes,
+                }
+            ),
+        )
+
+
+async def journal_orders(
+    journal: TenantJournal, request: web.Request
+) -> web.StreamResponse:
+    try:
+        limit = int(request.query.get("limit", "100"))
+        before = request.query.get("before")
+        before_id = None if before is None else int(before)
+    except ValueError:
+        raise web.HTTPBadRequest(text="limit and before must be integers")
+    if before_id is not None and not 0 < before_id <= MAX_ID:
+        raise web.HTTPBadRequest(text="before is out of range")
+    orders = await journal.list(limit, before_id)
+    return web.json_response(
+        [
+            {
+                "id": id,
+                "supplier": supplier,
+                "date": date,
+                "created": created,
+                "article_count": article_count,
+            }
+            for id, supplier, date, created, article_count in orders
+        ]
+    )
+
+
+async def journal_order(
+    journal: TenantJournal, request: web.Request
+) -> web.StreamResponse:
+    entry = await journal.get(int(request.match_info["id"]))
+    if entry is None:
+        raise web.HTTPNotFound
+    # the supplier info holds the tax and customer ids, addresses and phone
+    # numbers, it is only used to render the PDF again
+    return web.json_response(
+        {
+            "id": entry.id,
+            "supplier": entry.supplier,
+            "date": entry.date,
+            "created": entry.created,
+            "articles": entry.articles,
+        }
+    )
+
+
+async def journal_order_pdf(
+    journal: TenantJournal, renderer: PDFRenderer, request: web.Request
+) -> web.StreamResponse:
+    entry = await journal.get(int(request.match_info["id"]))
+    if entry is None:
+        raise web.HTTPNotFound
+    # the supplier info is the one from when it was ordered
+    pdf = await renderer.render(entry.articles, entry.date, entry.info)
+    return web.Response(body=pdf, content_type="application/pdf")
 
 
 @contextmanager
 def create_app(
     load_articles: ArticleLoader,
     load_suppliers: SupplierLoader,
+    pool: Optional[BuildDirectoryPool] = None,
+    renderer: Optional[PDFRenderer] = None,
+    journal: Optional[TenantJournal] = None,
 ) -> Iterator[web.Application]:
     app = web.Application()
-    with importlib.resources.path(
-        resources, "script.js"
-    ) as script_js, importlib.resources.path(resources, "style.css") as style_css:
+    if renderer is None:
+        renderer = PDFRenderer(pool)
+    with ExitStack() as stack:
+        routes = [
+            web.get("/", partial(index, load_articles)),
+        ]
+        assets = get_assets()
+        for name in ASSETS:
+            path = stack.enter_context(importlib.resources.path(resources, name))
+            # the plain names are kept for cached pages and other clients
+            routes.append(web.get(f"/{name}", partial(file, path)))
+            if name in assets:
+                routes.append(
+                    web.get(f"/{assets[name].name}", partial(asset, assets[name]))
+                )
         app.router.add_routes(
-            [
-                web.get("/", partial(index, load_articles)),
-                web.get("/script.js", partial(file, script_js)),
-                web.get("/style.css", partial(file, style_css)),
-                web.post("/order{tail:(/.*)?}", partial(order, load_suppliers)),
+            routes
+            + [
+                web.post(
+                    "/order{tail:(/.*)?}",
+                    partial(order, load_suppliers, renderer, journal),
+                ),
+                web.post("/draft", partial(draft, load_suppliers, renderer)),
             ]
         )
+        if journal is not None:
+            app.router.add_routes(
+                [
+                    web.get("/orders", partial(journal_orders, journal)),
+                    web.get(r"/orders/{id:\d+}", partial(journal_order, journal)),
+                    web.get(
+                        r"/orders/{id:\d+}.pdf",
+                        partial(journal_order_pdf, journal, renderer),
+                    ),
+                ]
+            )
+        yield app
+
+
+async def redirect(location: str, request: web.Request) -> web.StreamResponse:
+    raise web.HTTPMovedPermanently(location)
+
+
+def create_renderers(
+    tenants: List[Tenant], pool: Optional[BuildDirectoryPool] = None
+) -> List[PDFRenderer]:
+    # tenants have their own PDF caches but take turns at rendering drafts
+    speculative = asyncio.Semaphore(1)
+    return [
+        PDFRenderer(
+            pool,
+            max_cached=tenant.max_cached_pdfs,
+            max_cached_bytes=tenant.max_cached_pdf_bytes,
+            speculative=speculative,
+        )
+        for tenant in tenants
+    ]
+
+
+@contextmanager
+def create_tenants_app(
+    tenants: List[Tenant],
+    renderers: List[PDFRenderer],
+    journal: Optional[OrderJournal] = None,
+    trace_threshold: float = 1.0,
+) -> Iterator[web.Application]:
+    with ExitStack() as stack:
+        apps = []
+        for tenant, renderer in zip(tenants, renderers):
+            apps.append(
+                stack.enter_context(
+                    create_app(
+                        tenant.load_articles,
+                        tenant.load_suppliers,
+                        renderer=renderer,
+                        journal=(
+                            None
+                            if journal is None
+                            else TenantJournal(journal, tenant.prefix)
+                        ),
+                    )
+                )
+            )
+        if len(tenants) == 1 and not tenants[0].prefix:
+            app = apps[0]
+        else:
+            app = web.Application()
+            for tenant, subapp in zip(tenants, apps):
+                # the pages use relative links
+                app.router.add_get(
+                    tenant.prefix, partial(redirect, tenant.prefix + "/")
+                )
+                app.add_subapp(tenant.prefix, subapp)
+        app.middlewares.append(tracing_middleware(trace_threshold))
         yield app
 
 
@@ -259,53 +624,151 @@ def listen_address(arg: str) -> ListenAddress:
         return m["socket"]
 
 
+async def warm_up(tenants: List[Tenant], profile: StartupProfile) -> None:
+    async def load(loader: YAMLLoader) -> None:
+        with profile.measure(f"load {loader.name}"):
+            await loader()
+
+    loaders = {}  # type: Dict[int, YAMLLoader]
+    for tenant in tenants:
+        for loader in (tenant.load_articles, tenant.load_suppliers):
+            loaders[id(loader)] = loader
+    try:
+        await asyncio.gather(
+            asyncio.get_running_loop().run_in_executor(None, startup.warm_up, profile),
+            *map(load, loaders.values()),
+        )
+    except Exception:
+        # the first request will report it again
+        logging.getLogger(__name__).exception("warm-up failed")
+
+
 async def real_main(
-    load_articles: ArticleLoader,
-    load_suppliers: SupplierLoader,
+    tenants: List[Tenant],
     listen_addresses: List[ListenAddress],
+    pool: Optional[BuildDirectoryPool] = None,
+    profile: Optional[StartupProfile] = None,
+    journal_path: Optional[str] = None,
+    trace_threshold: float = 1.0,
+    profiler: Optional[SamplingProfiler] = None,
 ) -> None:
     assert listen_addresses
-    with create_app(load_articles, load_suppliers) as app:
-        runner = AppRunner(app)
-        await runner.setup()
-        try:
-            sites = []  # type: List[BaseSite]
-            for address in listen_addresses:
-                if isinstance(address, socket.socket):
-                    sites.append(SockSite(runner, address))
-                elif isinstance(address, str):
-                    sites.append(UnixSite(runner, address))
-                else:
-                    host, port = address
-                    sites.append(TCPSite(runner, host, port))
-            for site in sites:
-                await site.start()
-
-            while True:
-                await asyncio.sleep(3600)
-        except KeyboardInterrupt:
-            pass
-        finally:
-            await runner.cleanup()
+    if profile is None:
+        profile = StartupProfile()
+    # initialize everything that is only needed to answer requests while the
+    # sockets are set up
+    warming_up = asyncio.ensure_future(warm_up(tenants, profile))
+    # shut down cleanly so that queued orders are written to the journal
+    main_task = asyncio.current_task()
+    assert main_task is not None
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main_task.cancel)
+    if profiler is not None:
+        # sample the event loop's thread
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, profiler.start)
+    renderers = create_renderers(tenants, pool)
+    # memory and cache statistics are not exposed over HTTP
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGUSR2, lambda: asyncio.ensure_future(log_stats(tenants, renderers))
+    )
+    async with AsyncExitStack() as stack:
+        journal = None  # type: Optional[OrderJournal]
+        if journal_path is not None:
+            with profile.measure("open journal"):
+                journal = await stack.enter_async_context(OrderJournal(journal_path))
+        with create_tenants_app(tenants, renderers, journal, trace_threshold) as app:
+            runner = AppRunner(app, access_log_class=TracingAccessLogger)
+            with profile.measure("set up app runner"):
+                await runner.setup()
+            try:
+                with profile.measure("start sites"):
+                    sites = []  # type: List[BaseSite]
+                    for address in listen_addresses:
+                        if isinstance(address, socket.socket):
+                            sites.append(SockSite(runner, address))
+                        elif isinstance(address, str):
+                            sites.append(UnixSite(runner, address))
+                        else:
+                            host, port = address
+                            sites.append(TCPSite(runner, host, port))
+                    for site in sites:
+                        await site.start()
+
+                await warming_up
+                profile.report()
+
+                while True:
+                    await asyncio.sleep(3600)
+            except (KeyboardInterrupt, asyncio.CancelledError):
+                pass
+            finally:
+                await runner.cleanup()
 
 
 def main(argv: Optional[List[str]] = None) -> None:
+    started = time.perf_counter()
     p = argparse.ArgumentParser(
         description="...",
-        epilog=None
-        if systemd_imported
-        else "systemd socket activations cannot be used, because systemd.daemon could not be imported, see https://github.com/systemd/python-systemd",
+        epilog=(
+            None
+            if systemd_imported
+            else "systemd socket activations cannot be used, because systemd.daemon could not be imported, see https://github.com/systemd/python-systemd"
+        ),
     )
     p.add_argument(
         "--articles",
-        required=True,
         help="YAML file to load articles from",
     )
     p.add_argument(
         "--suppliers",
-        required=True,
         help="YAML file to load supplier infos from",
     )
+    p.add_argument(
+        "--tenants",
+        help="YAML file mapping URL prefixes to articles and supplier infos files, instead of --articles and --suppliers; on SIGUSR2 the memory and cache usage of each tenant is logged",
+    )
+    p.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes to parse YAML documents in parallel",
+    )
+    p.add_argument(
+        "--build-dir",
+        default=os.environ.get("RUNTIME_DIRECTORY"),
+        help="directory to keep reusable LaTeX build directories in, preferably on a tmpfs (default: $RUNTIME_DIRECTORY or the system's temporary directory)",
+    )
+    p.add_argument(
+        "--journal",
+        default=(
+            os.path.join(os.environ["STATE_DIRECTORY"], "orders.sqlite3")
+            if "STATE_DIRECTORY" in os.environ
+            else None
+        ),
+        help="SQLite database to record orders in (default: orders.sqlite3 in $STATE_DIRECTORY, if set)",
+    )
+    p.add_argument(
+        "--trace-threshold",
+        type=float,
+        default=1000,
+        help="log requests taking longer than this many milliseconds with a breakdown of where the time went (default: %(default)s)",
+    )
+    p.add_argument(
+        "--profile-seconds",
+        type=float,
+        default=10,
+        help="on SIGUSR1 sample the event loop for this many seconds and write the stacks in flamegraph.pl's folded format (default: %(default)s)",
+    )
+    p.add_argument(
+        "--profile-dir",
+        default=os.environ.get("STATE_DIRECTORY", tempfile.gettempdir()),
+        help="directory to write sampling profiles to (default: $STATE_DIRECTORY or the system's temporary directory)",
+    )
+    p.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print how long imports and initialisation took once the server is ready",
+    )
     g = p.add_mutually_exclusive_group(required=True)
     if systemd_imported:
         g.add_argument(
@@ -317,6 +780,14 @@ def main(argv: Optional[List[str]] = None) -> None:
         "-l", "--listen", type=listen_address, action="append", help="listening address"
     )
     args = p.parse_args(argv)
+    profile = StartupProfile(args.profile_startup)
+    profile.add("parse arguments", started)
+    files = (args.articles, args.suppliers)
+    if args.tenants is not None:
+        if files != (None, None):
+            p.error("--tenants cannot be combined with --articles or --suppliers")
+    elif None in files:
+        p.error("either --tenants or --articles and --suppliers are required")
 
     if systemd_imported and args.systemd:
         if not systemd.daemon.booted():
@@ -327,10 +798,35 @@ def main(argv: Optional[List[str]] = None) -> None:
     else:
         listen = args.listen
 
-    asyncio.run(
-        real_main(
-            ArticleLoader(args.articles),
-            SupplierLoader(args.suppliers),
-            listen,
+    with ExitStack() as stack:
+        executor = None  # type: Optional[Executor]
+        if args.jobs > 1:
+            executor = stack.enter_context(
+                ProcessPoolExecutor(
+                    args.jobs, mp_context=multiprocessing.get_context("forkserver")
+                )
+            )
+        if args.tenants is None:
+            tenants = [
+                Tenant(
+                    "",
+                    ArticleLoader(args.articles, executor),
+                    SupplierLoader(args.suppliers, executor),
+                )
+            ]
+        else:
+            with profile.measure("load tenants"):
+                tenants = load_tenants(args.tenants, executor)
+        with profile.measure("create build directory pool"):
+            pool = stack.enter_context(BuildDirectoryPool(args.build_dir))
+        asyncio.run(
+            real_main(
+                tenants,
+                listen,
+                pool,
+                profile,
+                args.journal,
+                args.trace_threshold / 1000,
+                SamplingProfiler(args.profile_dir, args.profile_seconds),
+            )
         )
-    )
@@ -119,6 +119,28 @@ function get_even_odd(table: HTMLTableElement): "even"|"odd" {
     }
 }
 
+function post_drafts(form: HTMLFormElement, delay: number): void {
+    // lets the server render the PDFs in the background, so that submitting
+    // an unchanged form returns immediately
+    const draft = Math.random().toString(36).slice(2)
+    let timer: number | undefined = undefined
+    const post = () => {
+        timer = undefined
+        const data = new FormData(form)
+        data.set("draft", draft)
+        fetch("draft", {method: "POST", body: data}).catch(console.error)
+    }
+    const schedule = () => {
+        if(timer !== undefined) {
+            window.clearTimeout(timer)
+        }
+        timer = window.setTimeout(post, delay)
+    }
+    form.addEventListener("input", schedule)
+    form.addEventListener("change", schedule)
+    form.addEventListener("reset", schedule)
+}
+
 document.addEventListener("DOMContentLoaded", () => {
     const date_picker = find_date_picker()
     console.log(date_picker)
@@ -143,4 +165,9 @@ document.addEventListener("DOMContentLoaded", () => {
             add_row(table, get_highest_index() + 1, get_even_odd(table), suppliers)
         })
     }
+
+    const form = document.querySelector("form")
+    if(form) {
+        post_drafts(form, 1000)
+    }
 })